@@ -51,11 +51,15 @@ MASTER_CONFIGS = {
 }
 
 # 连接池配置
-CONNECTION_POOL_SIZE = 3
+CONNECTION_POOL_SIZE = 4  # 并发操作数3 + 1条备用
+POOL_PREWARM = False  # 启动时并发预热短连接池
 CONNECT_TIMEOUT = 3.0
 CONNECT_RETRIES = 3
 RESPONSE_TIMEOUT = 2.0  # 响应超时
 
+# 调度配置
+PIN_CORE = False  # 将压测进程钉到单核并提升优先级（仅Windows生效）
+
 # 日志配置
 LOG_LEVEL = "DEBUG"
 LOG_ROTATION = "100 MB"  # 日志轮转大小
\ No newline at end of file
@@ -1,8 +1,11 @@
+import os
 import sys
 import time
 import ctypes
-import random
 import asyncio
+import functools
+import copy
+import numpy as np
 from datetime import datetime
 from loguru import logger
 from pymodbus.exceptions import ModbusException
@@ -10,31 +13,81 @@ from .async_connection import AsyncModbusConnection
 from config import settings
 from pathlib import Path
 
+# 保持寄存器地址边界在导入时固化为模块常量
+_HOLD_LO, _HOLD_HI = settings.HOLDING_REGISTER_RANGE
+
+# 3.11+的TaskGroup比gather少一层_GatheringFuture和逐任务回调
+_HAS_TASKGROUP = hasattr(asyncio, 'TaskGroup')
+
+# 报告模板在模块加载时构建一次，生成时只做一次format调用
+_REPORT_TMPL = """=== Modbus异步测试报告 ===
+测试时间: {timestamp}
+运行时长: {duration:.2f}秒
+总请求数: {total}
+成功请求: {ok}
+失败请求: {fail}
+QPS: {qps:.2f}
+成功率: {success_rate:.2f}%
+
+=== 周期统计 ===
+平均周期: {cycle_avg:.6f}ms
+最大周期: {cycle_max:.6f}ms
+最小周期: {cycle_min:.6f}ms
+周期抖动: {cycle_jitter:.6f}ms
+
+=== 报文延迟统计 ===
+总报文数: {n_all}
+平均延迟: {lat_avg:.3f}ms
+P50延迟: {p50:.3f}ms
+P95延迟: {p95:.3f}ms
+P99延迟: {p99:.3f}ms
+最大延迟: {lat_max:.3f}ms
+最小延迟: {lat_min:.3f}ms
+
+=== 各操作类型延迟 ===
+读输入寄存器平均: {ri_avg:.3f}ms (样本数: {ri_n})
+读保持寄存器平均: {rh_avg:.3f}ms (样本数: {rh_n})
+写寄存器平均: {wr_avg:.3f}ms (样本数: {wr_n})"""
+
+
 class HighPrecisionAsyncModbusClient:
     """高精度异步Modbus客户端"""
+
+    # 随机数池容量（操作参数池 / 写入数据池）
+    _RAND_POOL_SIZE = 65536
+    _VAL_POOL_SIZE = 1 << 20
+
+    # 统计环形缓冲区容量与抖动窗口
+    _STATS_BUF_SIZE = 1 << 20
+    _JITTER_WINDOW = 100
+
+    # 每周期并发操作数（不超过连接池大小）
+    _CONCURRENT_OPS = 3
+
+    # op_type -> 延迟统计键（与_client_ops返回的方法元组同序）
+    _OP_KEYS = ("read_input_registers", "read_holding_registers", "write_registers")
+
     def __init__(self):
         self.pool = AsyncModbusConnection()
         self._init_clock()
         self._set_clock_resolution()
+        self._init_random_pools()
+        self._init_stats_buffers()
+        self._ops_cache = {}
+        self._report_q = None
+        self._report_worker = None
         self.stats = {
             "总请求数": 0,
             "成功请求": 0,
             "失败请求": 0,
-            "开始时间": self._clock(),
-            "延迟记录": [],
-            "周期记录": [],
+            "开始时间": self._clock_ns(),
             "周期统计": {
                 "平均周期": 0.0,
                 "最大周期": 0.0,
                 "最小周期": float('inf'),
                 "周期抖动": 0.0
             },
-            "报文延迟统计": {
-                "read_input_registers": [],
-                "read_holding_registers": [],
-                "write_registers": [],
-                "所有报文": []
-            },
+            "报文延迟统计": {},
             "延迟百分位": {
                "p50": 0.0,
                 "p95": 0.0,
@@ -45,215 +98,394 @@ class HighPrecisionAsyncModbusClient:
 
         }
 
+    def _init_stats_buffers(self):
+        """预分配统计用NumPy环形缓冲区
+
+        无限增长的Python列表在长时间压测中产生百万级float对象的
+        GC压力，且逐周期sum/max/min全量扫描是O(N)。改为固定大小
+        环形缓冲 + 运行累加量，每周期更新摊还O(1)、内存恒定。
+        """
+        size = self._STATS_BUF_SIZE
+        self._cycle_buf = np.empty(size, dtype=np.float32)
+        self._cycle_n = 0  # 已写入总数（环形下标 = n % size）
+        self._cycle_sum = 0.0
+        self._lat_bufs = {
+            "read_input_registers": np.empty(size, dtype=np.float32),
+            "read_holding_registers": np.empty(size, dtype=np.float32),
+            "write_registers": np.empty(size, dtype=np.float32),
+            "所有报文": np.empty(size, dtype=np.float32),
+        }
+        self._lat_counts = {key: 0 for key in self._lat_bufs}
+
+    def _record_latency(self, key, latency_ms):
+        """O(1)写入一条延迟样本"""
+        n = self._lat_counts[key]
+        self._lat_bufs[key][n % self._STATS_BUF_SIZE] = latency_ms
+        self._lat_counts[key] = n + 1
+
+    def _lat_view(self, key):
+        """返回缓冲区中有效样本的视图"""
+        n = min(self._lat_counts[key], self._STATS_BUF_SIZE)
+        return self._lat_bufs[key][:n]
+
+    def _init_random_pools(self):
+        """预生成随机数池
+
+        热循环里逐次调用random.randint每个操作要3~13次Python调用，
+        改为用NumPy一次性批量生成，消费时只做O(1)索引递增。
+        """
+        self._rng = np.random.default_rng()
+        self._op_pool = self._rng.integers(0, 3, size=self._RAND_POOL_SIZE, dtype=np.uint8)
+        self._addr_pool = self._rng.integers(_HOLD_LO, _HOLD_HI + 1, size=self._RAND_POOL_SIZE, dtype=np.uint16)
+        self._cnt_pool = self._rng.integers(1, 11, size=self._RAND_POOL_SIZE, dtype=np.uint8)
+        self._val_pool = np.empty(self._VAL_POOL_SIZE, dtype=np.uint16)
+        self._refill_val_pool()
+        self._pool_idx = 0
+
+    def _refill_op_pools(self):
+        """耗尽后原地重新填充操作参数池（缓冲区身份不变）"""
+        self._op_pool[:] = self._rng.integers(0, 3, size=self._RAND_POOL_SIZE, dtype=np.uint8)
+        self._addr_pool[:] = self._rng.integers(_HOLD_LO, _HOLD_HI + 1, size=self._RAND_POOL_SIZE, dtype=np.uint16)
+        self._cnt_pool[:] = self._rng.integers(1, 11, size=self._RAND_POOL_SIZE, dtype=np.uint8)
+        self._pool_idx = 0
+
+    def _refill_val_pool(self):
+        """用内核随机源重填写入数据池
+
+        压测写入的数值分布无关紧要，os.urandom走getrandom(2)/
+        BCryptGenRandom的内核实现，按字节重解释为uint16即可，
+        比用户态RNG逐数生成更便宜。
+        """
+        self._val_pool[:] = np.frombuffer(
+            os.urandom(self._VAL_POOL_SIZE * 2), dtype=np.uint16)
+        self._val_idx = 0
+
+    def _next_op_params(self):
+        """从随机数池取出一组(op_type, addr, count)"""
+        idx = self._pool_idx
+        if idx >= self._RAND_POOL_SIZE:
+            self._refill_op_pools()
+            idx = 0
+        self._pool_idx = idx + 1
+        return int(self._op_pool[idx]), int(self._addr_pool[idx]), int(self._cnt_pool[idx])
+
+    def _next_values(self, count):
+        """从写入数据池切片取出count个寄存器值
+
+        直接对预分配池做视图切片再tolist()——除pymodbus要求的
+        小列表外没有任何每操作分配；池耗尽时原地重填。
+        """
+        idx = self._val_idx
+        if idx + count > self._VAL_POOL_SIZE:
+            self._refill_val_pool()
+            idx = 0
+        self._val_idx = idx + count
+        return self._val_pool[idx:idx + count].tolist()
+
     def _init_clock(self):
-        """初始化高精度时钟源"""
-        if hasattr(time, 'perf_counter'):
-            self._clock = time.perf_counter
-        else:
-            self._kernel32 = ctypes.windll.kernel32
-            self._qpc_freq = ctypes.c_int64()
-            self._kernel32.QueryPerformanceFrequency(ctypes.byref(self._qpc_freq))
-            self._clock = self._qpc_counter
+        """初始化高精度时钟源
 
-    def _qpc_counter(self):
-        """Windows高精度计时器"""
-        counter = ctypes.c_int64()
-        self._kernel32.QueryPerformanceCounter(ctypes.byref(counter))
-        return counter.value / self._qpc_freq.value
+        现代Python的perf_counter_ns在Windows上本身就封装QPC，
+        无需再经过ctypes手动调用；整数纳秒比较代替浮点运算，
+        既省去每次调用的float分配，也避免长时间运行的舍入漂移。
+        """
+        self._clock_ns = time.perf_counter_ns
 
     def _set_clock_resolution(self):
-        """Windows平台设置高精度时钟分辨率"""
-        if sys.platform == 'win32':
+        """Windows平台设置高精度时钟分辨率
+
+        timeBeginPeriod(1)会抬高全系统中断频率；测量精度本身
+        依赖QPC、并不需要它，它只影响time.sleep粒度。Win10 2004
+        (build 19041)起该调用已是进程级语义且sleep粒度足够，
+        只在更老的版本上才值得付出这份系统级开销。
+        """
+        if sys.platform == 'win32' and sys.getwindowsversion().build < 19041:
             self._winmm = ctypes.windll.winmm
             self._winmm.timeBeginPeriod(1)
 
-    def _busy_wait(self, target_delay):
-        """高精度忙等待"""
-        start = self._clock()
-        while True:
-            current = self._clock()
-            if current - start >= target_delay:
-                break
-            if target_delay - (current - start) > 0.002:
-                time.sleep(0.001)
-
-    async def _random_operation(self, client):
-        """执行随机Modbus操作（修正版）"""
-        op_type = random.randint(0, 2)
-        addr = random.randint(*settings.HOLDING_REGISTER_RANGE)
-        count = min(random.randint(1, 10), settings.MAX_REGISTERS_PER_READ)
+    async def _wait_until_ns(self, deadline_ns):
+        """等待到纳秒级截止时刻
+
+        距截止较远时用asyncio.sleep让出事件循环（留1.5ms余量
+        抵消调度器唤醒误差），最后的残余用整数比较自旋收尾——
+        纯LOAD_FAST+整数比较，没有浮点除法和对象分配。
+        """
+        clock_ns = self._clock_ns
+        remain_ns = deadline_ns - clock_ns()
+        if remain_ns > 2_000_000:
+            await asyncio.sleep((remain_ns - 1_500_000) / 1e9)
+        while clock_ns() < deadline_ns:
+            pass
+
+    def _client_ops(self, client):
+        """取得client的操作分发表（绑定方法元组，按op_type索引）
+
+        预先绑定三个方法，把每次操作的if/elif分支和属性查找
+        折叠成一次元组下标。client更换时由run_test清空缓存。
+        """
+        ops = self._ops_cache.get(id(client))
+        if ops is None:
+            ops = (client.read_input_registers,
+                   client.read_holding_registers,
+                   client.write_registers)
+            self._ops_cache[id(client)] = ops
+        return ops
+
+    def _plan_cycle(self):
+        """规划一个周期的操作，并合并可融合的读请求
+
+        先生成本周期全部(op_type, addr, count)三元组；两个同表读
+        重叠或紧邻（间隙≤1，与utils.merge_register_ranges同口径）
+        且并集不超过MAX_REGISTERS_PER_READ时合并为一次读——
+        信息量相同、少一次网络往返。只看总宽度会把相距上百个
+        寄存器的小读熔成一帧宽读，报文形状和延迟分布都会偏离
+        压测本意。每项最后一个元素记录合并了几个逻辑操作，
+        供统计按逻辑操作数归因。
+        """
+        max_span = settings.MAX_REGISTERS_PER_READ
+        planned = []
+        for _ in range(self._CONCURRENT_OPS):
+            op_type, addr, count = self._next_op_params()
+            for prev in planned:
+                # 只合并同表的读操作（op_type 0/1）
+                if prev[0] == op_type and op_type != 2:
+                    lo = min(prev[1], addr)
+                    hi = max(prev[1] + prev[2], addr + count)
+                    gap = max(prev[1], addr) - min(prev[1] + prev[2], addr + count)
+                    if gap <= 1 and hi - lo <= max_span:
+                        prev[1], prev[2] = lo, hi - lo
+                        prev[3] += 1
+                        break
+            else:
+                planned.append([op_type, addr, count, 1])
+        return planned
+
+    async def _execute_op(self, client, op_type, addr, count, n_logical=1):
+        """执行一次Modbus操作（可能承载多个合并后的逻辑操作）"""
+        # 热路径：把高频访问的属性提升为局部变量（LOAD_FAST）
+        clock_ns = self._clock_ns
+        record = self._record_latency
+        stats = self.stats
+
+        fn = self._client_ops(client)[op_type]
+        latency_key = self._OP_KEYS[op_type]
 
         try:
-            start = self._clock()
-            latency_key = ""
-
-            if op_type == 0:
-                await client.read_input_registers(address=addr, count=count)
-                latency_key = "read_input_registers"
-            elif op_type == 1:
-                await client.read_holding_registers(address=addr, count=count)
-                latency_key = "read_holding_registers"
-            else:
-                values = [random.randint(0, 65535) for _ in range(count)]
-                await client.write_registers(address=addr, values=values)
-                latency_key = "write_registers"
+            start_ns = clock_ns()
 
-            latency_ms = (self._clock() - start) * 1000
+            if op_type == 2:
+                await fn(address=addr, values=self._next_values(count))
+            else:
+                await fn(address=addr, count=count)
 
-            # 记录详细延迟
-            self.stats["报文延迟统计"][latency_key].append(latency_ms)
-            self.stats["报文延迟统计"]["所有报文"].append(latency_ms)
+            # 仅在记录时刻转换为毫秒
+            latency_ms = (clock_ns() - start_ns) / 1e6
 
-            # 更新全局延迟统计
-            self._update_latency_stats(latency_ms)
+            # 记录详细延迟（最大/最小值在报告阶段由缓冲区一次归约得出）
+            # 合并请求的延迟归因到每个逻辑操作，保持统计口径一致
+            for _ in range(n_logical):
+                record(latency_key, latency_ms)
+                record("所有报文", latency_ms)
 
-            self.stats["成功请求"] += 1
+            stats["成功请求"] += n_logical
             return True
 
         except ModbusException as e:
-            logger.error(f"Modbus操作失败: {e}")
-            self.stats["失败请求"] += 1
+            logger.error("Modbus操作失败: {}", e)
+            stats["失败请求"] += n_logical
             return False
         finally:
-            self.stats["总请求数"] += 1
+            stats["总请求数"] += n_logical
 
-    def _update_latency_stats(self, latency_ms):
-        """更新延迟百分位统计"""
-        stats = self.stats["延迟百分位"]
-        stats["最大值"] = max(stats["最大值"], latency_ms)
-        stats["最小值"] = min(stats["最小值"], latency_ms)
+    def _calculate_percentiles(self, arr):
+        """计算百分位延迟
 
-    def _calculate_percentiles(self, data):
-        """计算百分位延迟"""
-        if not data:
+        只需要三个位置的值，用np.partition做O(n)选择，
+        避免全量排序的O(n log n)和临时列表分配。
+        """
+        n = arr.size
+        if n == 0:
             return 0.0, 0.0, 0.0
 
-        sorted_data = sorted(data)
-        n = len(sorted_data)
-
-        p50 = sorted_data[int(n * 0.50)]
-        p95 = sorted_data[int(n * 0.95)]
-        p99 = sorted_data[int(n * 0.99)]
-
-        return p50, p95, p99
-
-    def _analyze_latencies(self):
-        """分析所有延迟数据"""
-        all_latencies = self.stats["报文延迟统计"]["所有报文"]
-        if not all_latencies:
-            return
-
-        # 计算百分位
-        p50, p95, p99 = self._calculate_percentiles(all_latencies)
-
-        self.stats["延迟百分位"].update({
-            "p50": p50,
-            "p95": p95,
-            "p99": p99,
-            "最大值": max(all_latencies),
-            "最小值": min(all_latencies)
-        })
-
-        # 各操作类型的平均延迟
-        for op_type in ["read_input_registers", "read_holding_registers", "write_registers"]:
-            latencies = self.stats["报文延迟统计"][op_type]
-            if latencies:
-                avg = sum(latencies) / len(latencies)
-                self.stats["报文延迟统计"][f"{op_type}_平均"] = avg
-
-    def _update_cycle_stats(self, cycle_time):
-        """更新周期统计数据"""
-        cycle_ms = cycle_time * 1000
-        self.stats["周期记录"].append(cycle_ms)
-
-        cycles = self.stats["周期记录"]
-        stats = self.stats["周期统计"]
-        stats["平均周期"] = sum(cycles) / len(cycles)
-        stats["最大周期"] = max(cycles)
-        stats["最小周期"] = min(cycles)
+        idx = np.minimum([n // 2, int(n * 0.95), int(n * 0.99)], n - 1)
+        part = np.partition(arr, idx)
+        return float(part[idx[0]]), float(part[idx[1]]), float(part[idx[2]])
 
-        recent = cycles[-100:] if len(cycles) >= 100 else cycles
-        if len(recent) > 1:
-            mean = sum(recent) / len(recent)
-            variance = sum((x - mean)**2 for x in recent) / (len(recent)-1)
-            stats["周期抖动"] = variance ** 0.5
+    def _update_cycle_stats(self, cycle_ms):
+        """更新周期统计数据（O(1)增量计算，入参为毫秒）"""
+        n = self._cycle_n
+        self._cycle_buf[n % self._STATS_BUF_SIZE] = cycle_ms
+        self._cycle_n = n + 1
+        self._cycle_sum += cycle_ms
+
+        stats = self.stats["周期统计"]
+        stats["平均周期"] = self._cycle_sum / self._cycle_n
+        if cycle_ms > stats["最大周期"]:
+            stats["最大周期"] = cycle_ms
+        if cycle_ms < stats["最小周期"]:
+            stats["最小周期"] = cycle_ms
+
+        # 周期抖动：最近100个周期的标准差（向量化）
+        if self._cycle_n > 1:
+            lo = max(0, self._cycle_n - self._JITTER_WINDOW)
+            recent = self._ring_slice(self._cycle_buf, lo, self._cycle_n)
+            stats["周期抖动"] = float(recent.std(ddof=1))
+
+    def _ring_slice(self, buf, lo, hi):
+        """取出环形缓冲区[lo, hi)区间的样本"""
+        size = self._STATS_BUF_SIZE
+        li, hi_i = lo % size, hi % size
+        if hi - lo >= size:
+            return buf
+        if li < hi_i:
+            return buf[li:hi_i]
+        return np.concatenate((buf[li:], buf[:hi_i]))
 
     async def run_test(self, duration):
         """运行异步压力测试"""
         logger.info("开始异步长连接压力测试...")
-        end_time = self._clock() + duration
-        client = await self.pool.get_connection()
+        end_ns = self._clock_ns() + int(duration * 1e9)
+
+        # 每个并发操作独占一条池内连接，事务才能真正在线路上并行
+        # （同一client上的并发请求会被pymodbus的内部互斥锁串行化）
+        clients = [await self.pool.get_connection() for _ in range(self._CONCURRENT_OPS)]
 
         # 预热阶段(忽略前10个周期的统计)
         warmup_cycles = 10
 
-        while self._clock() < end_time:
-            cycle_start = self._clock()
+        cycle_ns = int(settings.BUSY_WAIT_PRECISION * 1e9)
+
+        # 循环级缓存：避免每周期重复的属性/全局查找
+        clock_ns = self._clock_ns
+        gather = asyncio.gather
+        execute_op = self._execute_op
+        plan_cycle = self._plan_cycle
+        wait_until = self._wait_until_ns
+        update_cycle = self._update_cycle_stats
+
+        while clock_ns() < end_ns:
+            cycle_start_ns = clock_ns()
 
             try:
-                # 减少并发数以提高稳定性
-                tasks = [self._random_operation(client) for _ in range(3)]  # 从5降到3
-                await asyncio.gather(*tasks)
+                plan = plan_cycle()
+                if _HAS_TASKGROUP:
+                    async with asyncio.TaskGroup() as tg:
+                        for i, op in enumerate(plan):
+                            tg.create_task(execute_op(clients[i], *op))
+                else:
+                    await gather(*[execute_op(clients[i], *op)
+                                   for i, op in enumerate(plan)])
             except Exception as e:
-                logger.error(f"测试异常: {e}")
-                client = await self.pool.get_connection()
+                logger.error("测试异常: {}", e)
+                # 整组归还后重新取出，失效连接由池负责重建
+                for c in clients:
+                    await self.pool.release(c)
+                clients = [await self.pool.get_connection() for _ in range(self._CONCURRENT_OPS)]
+                self._ops_cache.clear()
 
-            # 精确周期控制(动态调整)
-            elapsed = self._clock() - cycle_start
-            target_wait = max(0, settings.BUSY_WAIT_PRECISION - elapsed)
-            if target_wait > 0.001:  # 只对较长的等待使用sleep
-                await asyncio.sleep(target_wait * 0.5)  # 部分异步等待
-                self._busy_wait(target_wait * 0.5)  # 部分忙等待
+            # 精确周期控制：基于纳秒整数截止时刻
+            await wait_until(cycle_start_ns + cycle_ns)
 
             # 更新统计(跳过预热周期)
             if warmup_cycles <= 0:
-                self._update_cycle_stats(self._clock() - cycle_start)
+                update_cycle((clock_ns() - cycle_start_ns) / 1e6)
             else:
                 warmup_cycles -= 1
 
-        self._generate_report()
-
-    def _generate_report(self):
-        """生成包含延迟统计的详细报告"""
-        # 先分析延迟数据
-        self._analyze_latencies()
-
-        # 准备报告内容
-        duration = self._clock() - self.stats["开始时间"]
-        qps = self.stats["总请求数"] / duration
-
-        report_lines = [
-            "=== Modbus异步测试报告 ===",
-            f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-            f"运行时长: {duration:.2f}秒",
-            f"总请求数: {self.stats['总请求数']}",
-            f"成功请求: {self.stats['成功请求']}",
-            f"失败请求: {self.stats['失败请求']}",
-            f"QPS: {qps:.2f}",
-            f"成功率: {(self.stats['成功请求'] / self.stats['总请求数']) * 100:.2f}%",
-            "",
-            "=== 周期统计 ===",
-            f"平均周期: {self.stats['周期统计']['平均周期']:.6f}ms",
-            f"最大周期: {self.stats['周期统计']['最大周期']:.6f}ms",
-            f"最小周期: {self.stats['周期统计']['最小周期']:.6f}ms",
-            f"周期抖动: {self.stats['周期统计']['周期抖动']:.6f}ms",
-            "",
-            "=== 报文延迟统计 ===",
-            f"总报文数: {len(self.stats['报文延迟统计']['所有报文'])}",
-            f"平均延迟: {sum(self.stats['报文延迟统计']['所有报文']) / len(self.stats['报文延迟统计']['所有报文']):.3f}ms",
-            f"P50延迟: {self.stats['延迟百分位']['p50']:.3f}ms",
-            f"P95延迟: {self.stats['延迟百分位']['p95']:.3f}ms",
-            f"P99延迟: {self.stats['延迟百分位']['p99']:.3f}ms",
-            f"最大延迟: {self.stats['延迟百分位']['最大值']:.3f}ms",
-            f"最小延迟: {self.stats['延迟百分位']['最小值']:.3f}ms",
-            "",
-            "=== 各操作类型延迟 ===",
-            f"读输入寄存器平均: {self.stats['报文延迟统计'].get('read_input_registers_平均', 0):.3f}ms (样本数: {len(self.stats['报文延迟统计']['read_input_registers'])})",
-            f"读保持寄存器平均: {self.stats['报文延迟统计'].get('read_holding_registers_平均', 0):.3f}ms (样本数: {len(self.stats['报文延迟统计']['read_holding_registers'])})",
-            f"写寄存器平均: {self.stats['报文延迟统计'].get('write_registers_平均', 0):.3f}ms (样本数: {len(self.stats['报文延迟统计']['write_registers'])})"
-        ]
-
-        report_content = "\n".join(report_lines)
+        for c in clients:
+            await self.pool.release(c)
+        await self._generate_report()
+
+    def _snapshot_stats(self):
+        """为后台报告生成拍一份统计快照
+
+        只做计数器浅拷贝和样本数组memcpy，重量级的百分位/均值
+        计算全部留给后台任务，调用方立即返回。
+        """
+        return {
+            "stats": copy.deepcopy(self.stats),
+            "lat": {key: self._lat_view(key).copy() for key in self._lat_bufs},
+            "counts": dict(self._lat_counts),
+            "duration": (self._clock_ns() - self.stats["开始时间"]) / 1e9,
+        }
+
+    def _ensure_report_worker(self):
+        """惰性启动后台报告任务（需要运行中的事件循环）"""
+        if self._report_worker is None:
+            self._report_q = asyncio.Queue()
+            self._report_worker = asyncio.create_task(self._report_consumer())
+
+    async def _report_consumer(self):
+        """带外报告工作者：消费统计快照并生成报告"""
+        while True:
+            snapshot = await self._report_q.get()
+            try:
+                await self._write_report(snapshot)
+            except Exception as e:
+                logger.error("生成报告失败: {}", e)
+            finally:
+                self._report_q.task_done()
+
+    async def _generate_report(self):
+        """快照当前统计并提交给后台报告任务"""
+        self._ensure_report_worker()
+        await self._report_q.put(self._snapshot_stats())
+
+    async def _write_report(self, snapshot):
+        """由快照生成包含延迟统计的详细报告"""
+        stats = snapshot["stats"]
+        lat = snapshot["lat"]
+        counts = snapshot["counts"]
+
+        # 先分析延迟数据（在后台任务中执行，与池关闭等清理重叠）
+        all_latencies = lat["所有报文"]
+        pct = stats["延迟百分位"]
+        op_avg = stats["报文延迟统计"]
+        if all_latencies.size:
+            p50, p95, p99 = self._calculate_percentiles(all_latencies)
+            pct.update({
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+                "最大值": float(all_latencies.max()),
+                "最小值": float(all_latencies.min())
+            })
+            for op_type in self._OP_KEYS:
+                if lat[op_type].size:
+                    op_avg[f"{op_type}_平均"] = float(lat[op_type].mean())
+
+        # 准备报告内容：每个统计项只取一次，避免重复的dict查找
+        cycle = stats["周期统计"]
+        total = stats["总请求数"]
+        n_all = counts["所有报文"]
+        duration = snapshot["duration"]
+
+        report_content = _REPORT_TMPL.format(
+            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            duration=duration,
+            total=total,
+            ok=stats["成功请求"],
+            fail=stats["失败请求"],
+            qps=total / duration,
+            success_rate=(stats["成功请求"] / total) * 100 if total else 0.0,
+            cycle_avg=cycle["平均周期"],
+            cycle_max=cycle["最大周期"],
+            cycle_min=cycle["最小周期"],
+            cycle_jitter=cycle["周期抖动"],
+            n_all=n_all,
+            lat_avg=float(all_latencies.mean()) if all_latencies.size else 0.0,
+            p50=pct["p50"],
+            p95=pct["p95"],
+            p99=pct["p99"],
+            lat_max=pct["最大值"],
+            lat_min=pct["最小值"],
+            ri_avg=op_avg.get("read_input_registers_平均", 0),
+            ri_n=counts["read_input_registers"],
+            rh_avg=op_avg.get("read_holding_registers_平均", 0),
+            rh_n=counts["read_holding_registers"],
+            wr_avg=op_avg.get("write_registers_平均", 0),
+            wr_n=counts["write_registers"],
+        )
 
         # 写入UTF-8文件
         report_dir = Path("reports")
@@ -262,11 +494,15 @@ class HighPrecisionAsyncModbusClient:
         report_path = report_dir / f"modbus_test_{timestamp}.txt"
 
         try:
-            with open(report_path, 'w', encoding='utf-8') as f:
-                f.write(report_content)
+            # 磁盘写入放到线程池执行器，避免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None,
+                functools.partial(report_path.write_text, report_content, encoding='utf-8')
+            )
             logger.info(f"测试报告已保存至: {report_path}")
         except Exception as e:
-            logger.error(f"保存测试报告失败: {e}")
+            logger.error("保存测试报告失败: {}", e)
 
         # 控制台输出
         print(report_content)
@@ -277,7 +513,7 @@ class HighPrecisionAsyncModbusClient:
 
         # 1. 确保测试报告生成
         try:
-            self._generate_report()
+            await self._generate_report()
         except Exception as e:
             logger.error(f"生成报告失败: {type(e).__name__}")
             cleanup_errors += 1
@@ -307,7 +543,19 @@ class HighPrecisionAsyncModbusClient:
             finally:
                 self.pool = None
 
-        # 4. 清理统计信息
+        # 4. 等待后台报告写完并收掉工作者任务
+        if self._report_worker is not None:
+            try:
+                await self._report_q.join()
+            except Exception as e:
+                logger.error(f"等待报告完成失败: {type(e).__name__}")
+                cleanup_errors += 1
+            finally:
+                self._report_worker.cancel()
+                self._report_worker = None
+                self._report_q = None
+
+        # 5. 清理统计信息
         self.stats.clear()
 
         if cleanup_errors > 0:
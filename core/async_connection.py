@@ -1,5 +1,6 @@
 import asyncio
 import socket
+from contextlib import asynccontextmanager
 from loguru import logger
 from pymodbus.client import AsyncModbusTcpClient
 from pymodbus.exceptions import ModbusException
@@ -7,24 +8,34 @@ from config import settings
 
 
 class AsyncModbusConnection:
-    """异步Modbus连接池"""
+    """异步Modbus连接池
+
+    真正的取出/归还(checkout/checkin)语义：每个并发任务独占一条
+    TCP连接，Modbus事务可以在多个socket上并行流水，而不是全部
+    串行挤在第一条建立的连接上。
+    """
 
     def __init__(self):
-        self._connections = []
+        self._pool = asyncio.Queue()
         self._lock = asyncio.Lock()
         self._initialized = False
 
     async def initialize(self):
-        """初始化连接池"""
-        if not self._initialized:
-            async with self._lock:
-                if not self._initialized:
-                    self._connections = [
-                        await self._create_connection()
-                        for _ in range(settings.CONNECTION_POOL_SIZE)
-                    ]
-                    self._initialized = True
-                    logger.info(f"连接池初始化完成，大小: {settings.CONNECTION_POOL_SIZE}")
+        """初始化连接池
+
+        稳态下的快路径检查放在锁外：GIL保证属性读取原子，
+        已初始化时直接返回，省去每次get_connection一轮
+        asyncio.Lock的acquire/release协程调度。
+        """
+        if self._initialized:
+            return
+        async with self._lock:
+            if self._initialized:
+                return
+            for _ in range(settings.CONNECTION_POOL_SIZE):
+                self._pool.put_nowait(await self._create_connection())
+            self._initialized = True
+            logger.info(f"连接池初始化完成，大小: {settings.CONNECTION_POOL_SIZE}")
 
     async def _create_connection(self):
         """创建新连接"""
@@ -41,78 +52,95 @@ class AsyncModbusConnection:
             if not client.connected:
                 raise ConnectionError("连接未建立")
 
+            self._tune_socket(client)
             logger.debug("创建新连接成功")
             return client
         except Exception as e:
-            logger.error(f"连接创建失败: {e}")
+            logger.error("连接创建失败: {}", e)
             raise
 
-    async def get_connection(self):
-        """获取长连接（带重试机制）"""
-        await self.initialize()
-
-        max_retries = 3
-        for attempt in range(max_retries):
-            for i, conn in enumerate(self._connections):
-                try:
-                    if conn is None:
-                        continue
+    def _tune_socket(self, client):
+        """调整异步连接的socket参数
 
-                    if not hasattr(conn, 'connected'):
-                        logger.warning(f"无效连接对象: {type(conn)}")
-                        self._connections[i] = None
-                        continue
+        同步连接池早已禁用Nagle，异步路径此前漏掉了——Nagle叠加
+        对端延迟ACK会给小报文的请求/响应带来最长40ms的停顿，
+        对1ms周期测试是灾难性的。Linux下再开TCP_QUICKACK关闭
+        本端延迟ACK。
+        """
+        try:
+            # pymodbus 3.10把asyncio transport挂在事务管理器上
+            # （client.ctx.transport），client本身没有transport属性；
+            # 保留直接属性作为版本兼容的兜底
+            ctx = getattr(client, 'ctx', None)
+            transport = (getattr(ctx, 'transport', None)
+                         or getattr(client, 'transport', None))
+            sock = transport.get_extra_info('socket') if transport else None
+            if sock is None:
+                logger.warning("无法获取底层socket，跳过TCP参数调整")
+                return
 
-                    if conn.connected:
-                        return conn
+            if settings.DISABLE_NAGLE:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if hasattr(socket, 'TCP_QUICKACK'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        except Exception as e:
+            logger.warning("TCP参数调整失败: {}", e)
 
-                except Exception as e:
-                    logger.error(f"检查连接状态出错: {e}")
-                    self._connections[i] = None
+    async def get_connection(self):
+        """取出一条连接（失效时在锁外重建）"""
+        await self.initialize()
 
-            # 所有连接都不可用，尝试重建
-            if attempt < max_retries - 1:
-                logger.warning(f"无可用连接，尝试重建... (尝试 {attempt + 1}/{max_retries})")
-                await asyncio.sleep(1)
-                await self.initialize()
+        conn = await self._pool.get()
+        # 健康检查在锁外完成，只有失效连接才触发重建
+        if conn is None or not getattr(conn, 'connected', False):
+            try:
+                conn = await self._create_connection()
+            except Exception:
+                # 用None占位归还，避免池容量永久缩水
+                self._pool.put_nowait(None)
+                raise ConnectionError("无法获取有效连接")
+        return conn
+
+    async def release(self, conn):
+        """归还连接回池"""
+        if conn is not None and getattr(conn, 'connected', False):
+            self._pool.put_nowait(conn)
+        else:
+            # 失效连接用None占位，下次取出时重建
+            self._pool.put_nowait(None)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """以上下文管理器方式取出/归还连接"""
+        conn = await self.get_connection()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
 
-        raise ConnectionError("无法获取有效连接")
+    async def _close_one(self, conn, index):
+        """关闭单条连接（兼容同步/异步close）"""
+        try:
+            if conn is None:
+                return
+            if not getattr(conn, 'connected', False):
+                logger.debug(f"连接{index}已断开，无需关闭")
+                return
+            result = conn.close()
+            if asyncio.iscoroutine(result):
+                await result
+            logger.debug(f"连接{index}已关闭")
+        except Exception as e:
+            logger.error(f"关闭连接{index}时出错: {type(e).__name__}: {str(e)}")
 
     async def close_all(self):
-        """终极安全关闭方法"""
+        """关闭并清空连接池"""
         async with self._lock:
-            if not hasattr(self, '_connections'):
-                logger.warning("连接池已被清空，无需关闭")
-                return
+            index = 0
+            while not self._pool.empty():
+                conn = self._pool.get_nowait()
+                await self._close_one(conn, index)
+                index += 1
 
-            for i in range(len(self._connections)):
-                conn = self._connections[i]
-                try:
-                    # 使用getattr安全检查，避免属性错误
-                    if conn is None:
-                        logger.debug(f"连接{i}已为None，跳过")
-                        continue
-
-                    if not getattr(conn, 'connected', False):
-                        logger.debug(f"连接{i}已断开，无需关闭")
-                        continue
-
-                    # 终极保护：检查是否可await
-                    if hasattr(conn, 'close') and callable(getattr(conn, 'close', None)):
-                        await conn.close()
-                        logger.debug(f"连接{i}已关闭")
-                    else:
-                        logger.warning(f"连接{i}没有可调用的close方法")
-
-                except Exception as e:
-                    logger.error(f"关闭连接{i}时出错: {type(e).__name__}: {str(e)}")
-                finally:
-                    # 确保设置为None
-                    self._connections[i] = None
-
-            self._connections = []
             self._initialized = False
             logger.info("连接池已完全关闭")
-
-
-
@@ -1,16 +1,28 @@
+import os
+import sys
 import time
+import atexit
 import ctypes
 import random
 import socket
+import numpy as np
+from collections import deque
 from datetime import datetime
 from loguru import logger
 from pymodbus.client import ModbusTcpClient
 from pymodbus.exceptions import ModbusException
 from config import settings
 from .connection import ModbusConnectionPool
+from .utils import LatencyHistogram
 
 
 class HighPrecisionModbusClient:
+
+    # 周期抖动的滑动窗口大小（最近N个周期）
+    _JITTER_WINDOW = 100
+    # 预生成写负载值池大小（uint16个数）
+    _VAL_POOL_SIZE = 1 << 16
+
     def __init__(self):
         self.pool = ModbusConnectionPool()
         self.stats = {
@@ -18,8 +30,6 @@ class HighPrecisionModbusClient:
             "成功请求": 0,
             "失败请求": 0,
             "开始时间": time.time(),
-            "延迟记录": [],
-            "周期记录": [],
             "周期统计": {
                 "平均周期": 0.0,
                 "最大周期": 0.0,
@@ -27,6 +37,93 @@ class HighPrecisionModbusClient:
                 "周期抖动": 0.0
             }
         }
+        # 请求计数用普通int累加，仅在生成报告时回灌stats字典：
+        # 混合类型字典的__setitem__和哈希开销不值得每操作付一次
+        self._total = 0
+        self._ok = 0
+        self._fail = 0
+        self._start_ns = time.perf_counter_ns()
+        # 直方图：O(1)内存拿到完整的延迟/周期百分位分布
+        self.latency_hdr = LatencyHistogram(1, 60_000_000, 3)   # 微秒，最大60s
+        self.cycle_hdr = LatencyHistogram(1, 60_000_000, 3)     # 微秒，最大60s
+        # 周期统计的运行累加量：O(1)更新，不随测试时长膨胀
+        self._cycle_n = 0
+        self._cycle_sum = 0.0
+        self._cycle_max = 0.0
+        self._cycle_min = float('inf')
+        self._recent_cycles = deque(maxlen=self._JITTER_WINDOW)
+        self._recent_sum = 0.0
+        self._recent_sumsq = 0.0
+        # 热路径缓存：random/settings的模块属性查找移出每次操作
+        self._rng = random.Random()
+        self._randint = self._rng.randint
+        self._addr_lo, self._addr_hi = settings.HOLDING_REGISTER_RANGE
+        self._max_regs = settings.MAX_REGISTERS_PER_READ
+        # 写负载从预生成值池切片，分配摊还到整池填充
+        self._val_pool = np.empty(self._VAL_POOL_SIZE, dtype=np.uint16)
+        self._val_pos = self._VAL_POOL_SIZE  # 首次使用时触发填充
+        # 级别判断缓存一次：DEBUG未启用时热路径完全跳过格式化
+        self._debug_enabled = logger._core.min_level <= logger.level("DEBUG").no
+        # 定时器惰性初始化：timeBeginPeriod是系统级副作用，
+        # 只在首次_busy_wait真正需要时才支付
+        self._wait_timer = None
+        self._wait_timer_ready = False
+        self._apply_scheduling()
+
+    def _apply_scheduling(self):
+        """提升进程优先级并钉到单核（降低周期抖动）
+
+        普通优先级加任意核迁移，每次上下文切换/核间漂移都会在
+        最大周期上砸出毫秒级尖峰。PIN_CORE开启时（仅Windows）
+        把进程提到HIGH_PRIORITY_CLASS并用亲和掩码钉在0号核上。
+        """
+        if not getattr(settings, 'PIN_CORE', False) or sys.platform != 'win32':
+            return
+        try:
+            k = ctypes.WinDLL('kernel32')
+            # HIGH_PRIORITY_CLASS = 0x00000080
+            k.SetPriorityClass(k.GetCurrentProcess(), 0x00000080)
+            k.SetThreadAffinityMask(k.GetCurrentThread(), 0x1)
+            logger.info("已提升进程优先级并绑定到0号核")
+        except Exception as e:
+            logger.warning(f"调度优化设置失败: {e}")
+
+    def _init_wait_timer(self):
+        """初始化Windows高精度等待定时器（首次_busy_wait时惰性调用）
+
+        Windows默认调度粒度15.6ms，纯time.sleep喂不出1ms节拍，
+        纯自旋又烧满一个核。winmm.timeBeginPeriod(1)把系统tick压到
+        1ms，再用高分辨率waitable timer让内核在到点时唤醒线程，
+        自旋只负责收尾的残余微秒。timeBeginPeriod抬高全系统中断
+        频率，不配速的运行不应为它买单，故推迟到第一次真正等待
+        时才初始化。非Windows平台退回纯自旋。
+        """
+        self._wait_timer_ready = True
+        self._wait_timer = None
+        if sys.platform != 'win32':
+            return
+        try:
+            self._winmm = ctypes.WinDLL('winmm')
+            self._winmm.timeBeginPeriod(1)
+            self._kernel32 = ctypes.WinDLL('kernel32')
+            # CREATE_WAITABLE_TIMER_HIGH_RESOLUTION=0x2, TIMER_ALL_ACCESS=0x1F0003
+            self._wait_timer = self._kernel32.CreateWaitableTimerExW(
+                None, None, 0x00000002, 0x1F0003
+            ) or None
+            atexit.register(self._teardown_wait_timer)
+        except Exception as e:
+            logger.warning(f"高精度定时器初始化失败，退回自旋等待: {e}")
+            self._wait_timer = None
+
+    def _teardown_wait_timer(self):
+        """恢复系统定时器精度并释放内核定时器句柄"""
+        try:
+            if self._wait_timer:
+                self._kernel32.CloseHandle(self._wait_timer)
+                self._wait_timer = None
+            self._winmm.timeEndPeriod(1)
+        except Exception:
+            pass
 
     def _setup_client(self):
         """配置客户端 (兼容PyModbus 3.x)"""
@@ -48,59 +145,117 @@ class HighPrecisionModbusClient:
             )
 
     def _busy_wait(self, target_delay):
-        """高精度忙等待"""
-        start = time.perf_counter()
-        while time.perf_counter() - start < target_delay:
+        """高精度忙等待
+
+        热循环里每圈做属性查找加浮点减法/比较，开销全摊在亚毫秒
+        预算里。改为局部绑定perf_counter_ns后对整数截止时刻自旋，
+        每圈只剩一次C调用和一次整数比较，无任何分配。
+        """
+        if not self._wait_timer_ready:
+            self._init_wait_timer()
+        clock = time.perf_counter_ns
+        deadline = clock() + int(target_delay * 1e9)
+
+        # Windows下让内核定时器睡掉大部分等待，自旋只收尾<50µs
+        if self._wait_timer is not None:
+            bulk_ns = int(target_delay * 1e9) - 50_000
+            if bulk_ns > 0:
+                due = ctypes.c_int64(-(bulk_ns // 100))  # 100ns单位，负值为相对时间
+                if self._kernel32.SetWaitableTimer(
+                        self._wait_timer, ctypes.byref(due), 0, None, None, 0):
+                    self._kernel32.WaitForSingleObject(self._wait_timer, 0xFFFFFFFF)
+
+        while clock() < deadline:
             pass
 
-    def _random_operation(self, conn):
-        """执行随机Modbus操作"""
-        op_type = random.randint(0, 2)
-        addr = random.randint(*settings.HOLDING_REGISTER_RANGE)
-        count = random.randint(1, settings.MAX_REGISTERS_PER_READ)
+    def _next_values(self, count):
+        """从预生成值池切出count个写负载值
+
+        每次写操作现做一个新数组再tolist()，分配压力全落在热
+        路径上。值池整块用os.urandom原地重填（uint16重解释），
+        单次取值只剩切片+tolist，分配代价摊还到每65536个值一次。
+        """
+        pos = self._val_pos
+        if pos + count > self._VAL_POOL_SIZE:
+            self._val_pool[:] = np.frombuffer(
+                os.urandom(self._VAL_POOL_SIZE * 2), dtype=np.uint16)
+            pos = 0
+        self._val_pos = pos + count
+        return self._val_pool[pos:self._val_pos].tolist()
+
+    def _random_operation(self, conn, randint, addr_lo, addr_hi, max_regs):
+        """执行随机Modbus操作
+
+        随机源与地址/数量上限由run_test以参数传入：调用方循环头
+        一次性绑定为局部变量，每次操作只走LOAD_FAST，不再经过
+        实例属性查找。
+        """
+        op_type = randint(0, 2)
+        addr = randint(addr_lo, addr_hi)
+        count = randint(1, max_regs)
 
         try:
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
 
             if op_type == 0:  # 读输入寄存器
                 result = conn.read_input_registers(address=addr, count=count)
-                # logger.debug(f"读输入寄存器 {addr}-{addr + count}: {result.registers}")
+                if self._debug_enabled:
+                    logger.debug("读输入寄存器 {}-{}: {}", addr, addr + count, result.registers)
             elif op_type == 1:  # 读保持寄存器
                 result = conn.read_holding_registers(address=addr, count=count)
-                # logger.debug(f"读保持寄存器 {addr}-{addr + count}: {result.registers}")
+                if self._debug_enabled:
+                    logger.debug("读保持寄存器 {}-{}: {}", addr, addr + count, result.registers)
             else:  # 写保持寄存器
-                values = [random.randint(0, 65535) for _ in range(count)]
+                values = self._next_values(count)
                 result = conn.write_registers(address=addr, values=values)
-                # logger.debug(f"写保持寄存器 {addr}-{addr + count}: {values}")
+                if self._debug_enabled:
+                    logger.debug("写保持寄存器 {}-{}: {}", addr, addr + count, values)
 
-            latency = (time.time() - start_time) * 1000  # 毫秒
-            self.stats["延迟记录"].append(latency)
-            self.stats["成功请求"] += 1
+            # 纳秒整数差值直接进直方图，无浮点乘法与字典更新
+            self.latency_hdr.record((time.perf_counter_ns() - start_ns) // 1000)
+            self._ok += 1
             return True
         except ModbusException as e:
             logger.error(f"Modbus操作失败: {e}")
-            self.stats["失败请求"] += 1
+            self._fail += 1
             return False
         finally:
-            self.stats["总请求数"] += 1
+            self._total += 1
 
     def _update_cycle_stats(self, cycle_time):
-        """更新周期统计数据"""
-        # 记录当前周期时间(毫秒)
-        self.stats["周期记录"].append(cycle_time * 1000)
-
-        # 更新统计指标
-        cycles = self.stats["周期记录"]
-        self.stats["周期统计"]["平均周期"] = sum(cycles) / len(cycles)
-        self.stats["周期统计"]["最大周期"] = max(cycles)
-        self.stats["周期统计"]["最小周期"] = min(cycles)
-
-        # 计算周期抖动(最近100个周期的标准差)
-        recent_cycles = cycles[-100:] if len(cycles) >= 100 else cycles
-        if len(recent_cycles) > 1:
-            mean = sum(recent_cycles) / len(recent_cycles)
-            variance = sum((x - mean) ** 2 for x in recent_cycles) / (len(recent_cycles) - 1)
-            self.stats["周期统计"]["周期抖动"] = variance ** 0.5
+        """更新周期统计数据（O(1)增量计算）
+
+        全量遍历周期列表每周期都是O(N)，12小时的测试下来总功
+        达O(N²)。改为运行累加量求均值/极值，抖动用带增量平方和
+        的固定窗口deque——挤出旧值时同步扣减，无需重扫窗口。
+        """
+        ms = cycle_time * 1000
+        self.cycle_hdr.record(ms * 1000)
+        self._cycle_n += 1
+        self._cycle_sum += ms
+        if ms > self._cycle_max:
+            self._cycle_max = ms
+        if ms < self._cycle_min:
+            self._cycle_min = ms
+
+        recent = self._recent_cycles
+        if len(recent) == recent.maxlen:
+            evicted = recent[0]
+            self._recent_sum -= evicted
+            self._recent_sumsq -= evicted * evicted
+        recent.append(ms)
+        self._recent_sum += ms
+        self._recent_sumsq += ms * ms
+
+        stats = self.stats["周期统计"]
+        stats["平均周期"] = self._cycle_sum / self._cycle_n
+        stats["最大周期"] = self._cycle_max
+        stats["最小周期"] = self._cycle_min
+
+        n = len(recent)
+        if n > 1:
+            variance = (self._recent_sumsq - self._recent_sum * self._recent_sum / n) / (n - 1)
+            stats["周期抖动"] = variance ** 0.5 if variance > 0 else 0.0
 
     def _print_cycle_stats(self):
         """打印周期统计信息"""
@@ -115,35 +270,57 @@ class HighPrecisionModbusClient:
         )
 
     def run_test(self, duration, use_busy_wait=True):
-        """使用长连接运行压力测试（完整版）"""
+        """使用长连接运行压力测试（完整版）
+
+        use_busy_wait开启时按BUSY_WAIT_PRECISION配速：操作提前
+        完成的周期用_busy_wait等到节拍边界再进下一轮，周期统计
+        反映的是节拍保持能力而不是裸吞吐。
+        """
         logger.info("开始Modbus长连接压力测试...")
-        end_time = time.time() + duration
+        # 单调时钟截止时刻只算一次；每轮只取一次now，终止判断、
+        # 周期计时和打印门共用，免疫NTP校时跳变
+        clock = time.monotonic
+        deadline = clock() + duration
+        next_print = clock() + 1.0
         conn = None
+        # 热路径参数绑定为局部变量，循环内全走LOAD_FAST
+        randint = self._randint
+        addr_lo, addr_hi = self._addr_lo, self._addr_hi
+        max_regs = self._max_regs
+        cycle_s = settings.BUSY_WAIT_PRECISION
+        busy_wait = self._busy_wait
 
         try:
-            # 获取长连接（整个测试周期共用）
-            conn = self.pool.get_persistent_connection()
-
-            while time.time() < end_time:
-                cycle_start = time.time()
+            while (cycle_start := clock()) < deadline:
 
                 try:
-                    if not self._random_operation(conn):
+                    # 初始获取与异常恢复共用同一处（长连接整个测试周期共用）
+                    if conn is None:
+                        conn = self.pool.get_persistent_connection()
+                    if not self._random_operation(conn, randint, addr_lo,
+                                                  addr_hi, max_regs):
                         self._handle_connection_error(conn)
 
                 except Exception as e:
                     logger.error(f"测试发生异常: {e}")
                     self._save_error_report(e)
-                    # 异常后自动获取新连接
-                    conn = self.pool.get_persistent_connection()
+                    # 置空后下一轮循环统一重新获取
+                    conn = None
+
+                # 周期配速：提前完成时等到节拍边界
+                if use_busy_wait:
+                    remain = cycle_start + cycle_s - clock()
+                    if remain > 0:
+                        busy_wait(remain)
 
                 # 更新统计
-                cycle_time = time.time() - cycle_start
-                self._update_cycle_stats(cycle_time)
+                cycle_end = clock()
+                self._update_cycle_stats(cycle_end - cycle_start)
 
-                # 定期打印统计
-                if len(self.stats["周期记录"]) % 100 == 0:
+                # 每秒打印一次统计
+                if cycle_end >= next_print:
                     self._print_cycle_stats()
+                    next_print = cycle_end + 1.0
 
         except KeyboardInterrupt:
             logger.warning("测试被手动中断")
@@ -154,6 +331,26 @@ class HighPrecisionModbusClient:
             # 如需立即关闭可取消注释下行
             self.pool.close_persistent_connection()
 
+    def run_test_async(self, duration):
+        """以asyncio流水线模式运行压力测试
+
+        阻塞式pymodbus一条连接同一时刻只有一个在途请求，吞吐被
+        网络RTT限死。core.async_client已经有基于AsyncModbusTcpClient
+        连接池的多在途流水线实现，这里直接委托过去，不在同步
+        客户端里重复维护一份协程逻辑。
+        """
+        import asyncio
+        from .async_client import HighPrecisionAsyncModbusClient
+
+        async def _run():
+            client = HighPrecisionAsyncModbusClient()
+            try:
+                await client.run_test(duration)
+            finally:
+                await client.cleanup()
+
+        asyncio.run(_run())
+
     def _handle_connection_error(self, conn):
         """处理连接错误"""
         logger.warning("连接异常，尝试重新连接...")
@@ -175,36 +372,55 @@ class HighPrecisionModbusClient:
             import traceback
             traceback.print_exc(file=f)
 
+    def _flush_stats(self):
+        """把运行期int计数器回灌到stats字典"""
+        self.stats["总请求数"] = self._total
+        self.stats["成功请求"] = self._ok
+        self.stats["失败请求"] = self._fail
+
     def _generate_report(self):
         """生成测试报告"""
-        duration = time.time() - self.stats["开始时间"]
+        self._flush_stats()
+        duration = (time.perf_counter_ns() - self._start_ns) / 1e9
         qps = self.stats["总请求数"] / duration
         success_rate = (self.stats["成功请求"] / self.stats["总请求数"]) * 100 if self.stats["总请求数"] > 0 else 0
 
-        latencies = self.stats["延迟记录"]
-        avg_latency = sum(latencies) / len(latencies) if latencies else 0
-        max_latency = max(latencies) if latencies else 0
+        lat = self.latency_hdr
+        avg_latency = lat.mean_us / 1000
+        max_latency = lat.max_us / 1000
 
         cycle_stats = self.stats["周期统计"]
 
-        report = f"""
-=== Modbus压力测试报告 ===
-测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-运行时长: {duration:.2f}秒
-总请求数: {self.stats["总请求数"]}
-成功请求: {self.stats["成功请求"]}
-失败请求: {self.stats["失败请求"]}
-QPS: {qps:.2f}
-成功率: {success_rate:.2f}%
-平均延迟: {avg_latency:.2f}ms
-最大延迟: {max_latency:.2f}ms
---- 周期统计 ---
-平均周期: {cycle_stats['平均周期']:.6f}ms
-最大周期: {cycle_stats['最大周期']:.6f}ms
-最小周期: {cycle_stats['最小周期']:.6f}ms
-周期抖动: {cycle_stats['周期抖动']:.6f}ms
-"""
-        filename = f"reports/report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(report)
+        # datetime.now()只取一次，报告行攒在列表里一次join写出，
+        # 大缓冲避免多次小块write的系统调用
+        now = datetime.now()
+        parts = [
+            "",
+            "=== Modbus压力测试报告 ===",
+            f"测试时间: {now.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"运行时长: {duration:.2f}秒",
+            f"总请求数: {self.stats['总请求数']}",
+            f"成功请求: {self.stats['成功请求']}",
+            f"失败请求: {self.stats['失败请求']}",
+            f"QPS: {qps:.2f}",
+            f"成功率: {success_rate:.2f}%",
+            f"平均延迟: {avg_latency:.2f}ms",
+            f"P50延迟: {lat.percentile_us(50) / 1000:.2f}ms",
+            f"P90延迟: {lat.percentile_us(90) / 1000:.2f}ms",
+            f"P99延迟: {lat.percentile_us(99) / 1000:.2f}ms",
+            f"P99.9延迟: {lat.percentile_us(99.9) / 1000:.2f}ms",
+            f"最大延迟: {max_latency:.2f}ms",
+            "--- 周期统计 ---",
+            f"平均周期: {cycle_stats['平均周期']:.6f}ms",
+            f"P50周期: {self.cycle_hdr.percentile_us(50) / 1000:.6f}ms",
+            f"P99周期: {self.cycle_hdr.percentile_us(99) / 1000:.6f}ms",
+            f"P99.9周期: {self.cycle_hdr.percentile_us(99.9) / 1000:.6f}ms",
+            f"最大周期: {cycle_stats['最大周期']:.6f}ms",
+            f"最小周期: {cycle_stats['最小周期']:.6f}ms",
+            f"周期抖动: {cycle_stats['周期抖动']:.6f}ms",
+            "",
+        ]
+        filename = f"reports/report_{now.strftime('%Y%m%d_%H%M%S')}.txt"
+        with open(filename, 'w', encoding='utf-8', buffering=1 << 16) as f:
+            f.write("\n".join(parts))
         logger.info(f"测试报告已保存到 {filename}")
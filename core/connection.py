@@ -1,12 +1,36 @@
+import os
+import sys
+import atexit
+import itertools
+import random
 import socket
 import threading
 import time
-import ctypes
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from pymodbus.client import ModbusTcpClient
 from pymodbus.exceptions import ModbusException
 from config import settings
 
+# 级别判断缓存一次：DEBUG未启用时心跳路径不做任何计时
+_DEBUG_ENABLED = logger._core.min_level <= logger.level("DEBUG").no
+
+# 平台相关的socket选项在导入时展开成常量表，建连时单循环下发，
+# 免去每次建连的分支判断；支持的平台上SO_KEEPALIVE必然存在，
+# 无需hasattr探测
+_SOCKET_OPTS = (
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, int(settings.DISABLE_NAGLE)),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+)
+if sys.platform == 'linux':
+    # 10s空闲后开始探测，3s间隔，3次失败判死
+    _SOCKET_OPTS += (
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 10),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 3),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3),
+    )
+
 
 class ModbusConnectionPool:
     """支持长连接模式的线程安全连接池（适配PyModbus 3.x）"""
@@ -14,7 +38,15 @@ class ModbusConnectionPool:
     _instance = None
     _instance_lock = threading.Lock()
 
+    # 空闲不足该秒数的连接视为新鲜，取还时跳过liveness检查，
+    # 真正的断链探测交给内核KeepAlive
+    _LIVENESS_IDLE_S = 5.0
+
     def __new__(cls):
+        # 双重检查锁：单例已存在时免锁直返。属性发布在锁内完成，
+        # CPython内存模型下锁外读安全
+        if cls._instance is not None:
+            return cls._instance
         with cls._instance_lock:
             if cls._instance is None:
                 cls._instance = super().__new__(cls)
@@ -30,31 +62,78 @@ class ModbusConnectionPool:
         self._host = settings.CONTROLLER_IP
         self._port = settings.CONTROLLER_PORT
         self._size = settings.CONNECTION_POOL_SIZE
-        self._lock = threading.Lock()
-        self._pool = []
+        # 按线程分片的短连接池：get/release先命中本线程分片，
+        # 避免并行worker全部挤在同一条队列的内部锁上。分片用
+        # deque——CPython下append/pop是GIL原子操作，争用路径只剩
+        # 一条原子指令而非整段临界区；从右端pop保持LIFO、优先
+        # 复用最热的连接。总容量按分片均分（余数摊给前几片），
+        # 聚合上限仍是配置的CONNECTION_POOL_SIZE
+        self._num_shards = max(1, min(self._size, os.cpu_count() or 1))
+        self._pools = [deque() for _ in range(self._num_shards)]
+        per_shard, extra = divmod(self._size, self._num_shards)
+        self._slots = [threading.Semaphore(per_shard + (1 if i < extra else 0))
+                       for i in range(self._num_shards)]
+        # 分片指派用轮转计数器而非get_ident取模：CPython线程ident
+        # 是pthread栈地址，对齐粒度远大于分片数，取模后所有线程
+        # 都落在0号分片。每线程首次访问时从计数器领号并记入TLS，
+        # itertools.count的next在GIL下原子
+        self._shard_cursor = itertools.count()
+        self._shard_tls = threading.local()
+        self._release_count = 0
 
         # 长连接专用属性
         self._persistent_conn = None
         self._persistent_lock = threading.Lock()
         self._last_heartbeat = 0
 
+        # 解释器关闭阶段的__del__极易死锁，改为atexit显式清理
+        atexit.register(self.close_all)
+
+        if getattr(settings, 'POOL_PREWARM', False):
+            self.prewarm()
+
+    def prewarm(self):
+        """并发预热短连接池
+
+        串行建连的启动代价是池容量×握手RTT；用线程池并发建连把
+        墙钟时间压到约一个RTT，网络I/O全程不持有任何池内锁。
+        入池按分片轮转直接摆放：经release_connection归还会全部
+        落进调用线程自己的分片，超出该分片均分容量的连接当场
+        被关掉，预热等于白做。
+        """
+        with ThreadPoolExecutor(max_workers=self._size) as ex:
+            conns = list(ex.map(lambda _: self._create_connection(),
+                                range(self._size)))
+        idx = 0
+        for conn in conns:
+            if conn is None:
+                continue
+            conn._last_used = time.monotonic()
+            # 逐分片找有空位的槽，各分片都满才关连接
+            for _ in range(self._num_shards):
+                if self._slots[idx % self._num_shards].acquire(blocking=False):
+                    self._pools[idx % self._num_shards].append(conn)
+                    idx += 1
+                    break
+                idx += 1
+            else:
+                try:
+                    conn.close()
+                except:
+                    pass
+
     def _setup_socket_options(self, sock):
-        """配置Socket参数（Windows/Linux通用）"""
+        """配置Socket参数（按预展开的常量表单循环下发）"""
         try:
-            # 禁用Nagle算法（关键修改点）
-            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(settings.DISABLE_NAGLE))
-
-            # 启用KeepAlive
-            if hasattr(socket, 'SO_KEEPALIVE'):
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-                # Windows特定配置
-                if hasattr(ctypes, 'windll'):
-                    try:
-                        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, 10000, 3000))  # 10s空闲,3s间隔
-                    except:
-                        logger.warning("无法设置Windows KeepAlive参数")
+            for level, opt, val in _SOCKET_OPTS:
+                sock.setsockopt(level, opt, val)
+            if sys.platform == 'win32':
+                try:
+                    sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, 10000, 3000))  # 10s空闲,3s间隔
+                except:
+                    logger.warning("无法设置Windows KeepAlive参数")
         except Exception as e:
-            logger.error(f"Socket配置失败: {e}")
+            logger.error("Socket配置失败: {}", e)
 
     def _create_connection(self, persistent=False):
         """创建新连接（适配PyModbus 3.x API）"""
@@ -84,15 +163,23 @@ class ModbusConnectionPool:
             if not client.connect():
                 raise ConnectionError("连接失败")
 
-            # 长连接需验证
-            if persistent and not self._test_connection(client):
-                raise ConnectionError("长连接验证失败")
-
-            logger.success(f"连接建立 {self._host}:{self._port} [{'持久' if persistent else '临时'}]")
+            # pymodbus的connect()可能弃用注入socket、自建新的，
+            # 在实际生效的那个socket上再确认一次TCP参数，否则
+            # Nagle+延迟ACK会给每个小报文请求叠加最长40ms停顿
+            try:
+                live_sock = (getattr(client, 'socket', None)
+                             or getattr(client, '_socket', None))
+                if live_sock is not None and live_sock is not sock:
+                    self._setup_socket_options(live_sock)
+            except AttributeError:
+                pass
+
+            logger.success("连接建立 {}:{} [{}]", self._host, self._port,
+                           '持久' if persistent else '临时')
             return client
 
         except Exception as e:
-            logger.error(f"连接创建失败: {e}")
+            logger.error("连接创建失败: {}", e)
             if 'sock' in locals():
                 sock.close()
             if 'client' in locals():
@@ -100,58 +187,146 @@ class ModbusConnectionPool:
             return None
 
     def _test_connection(self, conn):
-        """测试连接有效性（优化版心跳检测）"""
+        """廉价连接健康检查（不发Modbus报文）
+
+        原实现每次校验都发一条read_holding_registers，取用/归还
+        各付一个完整RTT，连接池反而把每个真实操作的代价翻了倍。
+        改查socket层的fileno/SO_ERROR，失败留给调用方的重连逻辑
+        兜底；真正的Modbus探测只保留在长连接恢复路径
+        （_probe_connection）。
+        """
+        try:
+            sock = getattr(conn, 'socket', None)
+            return (sock is not None and sock.fileno() != -1
+                    and sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0)
+        except Exception:
+            return False
+
+    def _probe_connection(self, conn):
+        """完整Modbus心跳探测（仅长连接建立/恢复时使用）
+
+        计时只在DEBUG启用时进行：monotonic_ns走vDSO无系统调用、
+        整数运算不产生浮点对象，生产级别下探测路径完全零计时。
+        """
         try:
-            start_time = time.time()
-            result = conn.read_holding_registers(address=0, count=1)
-            latency = (time.time() - start_time) * 1000
-            if latency > 100:  # 记录慢速心跳
-                logger.warning(f"心跳延迟过高: {latency:.2f}ms")
+            if _DEBUG_ENABLED:
+                start_ns = time.monotonic_ns()
+                result = conn.read_holding_registers(address=0, count=1)
+                latency = (time.monotonic_ns() - start_ns) / 1_000_000
+                if latency > 100:  # 记录慢速心跳
+                    logger.warning("心跳延迟过高: {:.2f}ms", latency)
+            else:
+                result = conn.read_holding_registers(address=0, count=1)
             return not result.isError()
         except Exception as e:
-            logger.debug(f"心跳检测失败: {e}")
+            if _DEBUG_ENABLED:
+                logger.debug("心跳检测失败: {}", e)
             return False
 
     def get_persistent_connection(self):
         """获取/维持长连接（带自动重连和熔断机制）"""
         with self._persistent_lock:
+            # 快路径：距上次心跳不足5秒免探测直返。每次取连接都发
+            # 一条Modbus读等于给每个真实操作预付一个RTT；窗口内的
+            # 断链由内核KeepAlive兜底，操作失败时调用方重连逻辑
+            # 自会回到下面的探测/重建路径
+            if (self._persistent_conn
+                    and time.monotonic_ns() - self._last_heartbeat < 5_000_000_000):
+                return self._persistent_conn
+
             # 存在可用连接时直接返回
-            if self._persistent_conn and self._test_connection(self._persistent_conn):
-                self._last_heartbeat = time.time()
+            if self._persistent_conn and self._probe_connection(self._persistent_conn):
+                self._last_heartbeat = time.monotonic_ns()
                 return self._persistent_conn
 
-            # 需要重建连接
+            # 需要重建连接。验证探测只留在这条恢复路径上：
+            # 普通建连TCP握手成功即可用，多发一条Modbus读纯属浪费
             retry_count = 0
             while retry_count < 3:  # 最大重试3次
                 self._persistent_conn = self._create_connection(persistent=True)
-                if self._persistent_conn:
-                    self._last_heartbeat = time.time()
+                if self._persistent_conn and self._probe_connection(self._persistent_conn):
+                    self._last_heartbeat = time.monotonic_ns()
                     return self._persistent_conn
+                if self._persistent_conn:
+                    try:
+                        self._persistent_conn.close()
+                    except:
+                        pass
+                    self._persistent_conn = None
 
                 retry_count += 1
-                time.sleep(2 ** retry_count)  # 指数退避
+                # 带抖动、有上限的退避：固定2/4/8秒会让所有等待者
+                # 同步撞向刚恢复的PLC；睡眠期间释放持久锁，其他
+                # 检查者得以观察恢复而不是整批卡死
+                delay = random.uniform(0.1, min(5.0, 0.2 * (2 ** retry_count)))
+                self._persistent_lock.release()
+                try:
+                    time.sleep(delay)
+                finally:
+                    self._persistent_lock.acquire()
 
             raise ConnectionError("长连接建立失败，已达最大重试次数")
 
-    # 短连接池方法保持不变
+    def _shard_index(self):
+        """当前线程对应的分片下标（首次访问时轮转指派）"""
+        idx = getattr(self._shard_tls, 'shard', None)
+        if idx is None:
+            idx = next(self._shard_cursor) % self._num_shards
+            self._shard_tls.shard = idx
+        return idx
+
     def get_connection(self):
-        """从池中获取短连接"""
-        with self._lock:
-            return self._pool.pop() if self._pool else self._create_connection()
+        """从池中获取短连接
+
+        先扫本线程分片，落空再退到兄弟分片；逐分片有界循环丢弃
+        失效连接，既不递归也不持有全局锁。全部落空时直接新建
+        （池从不预填，阻塞等待只会白等超时）。
+        """
+        base = self._shard_index()
+        for offset in range(self._num_shards):
+            idx = (base + offset) % self._num_shards
+            shard = self._pools[idx]
+            for _ in range(self._size):
+                try:
+                    conn = shard.pop()
+                except IndexError:
+                    break
+                self._slots[idx].release()
+                # 刚用过的连接免检：断链由内核KeepAlive兜底
+                if (time.monotonic() - getattr(conn, '_last_used', 0.0)
+                        < self._LIVENESS_IDLE_S or self._test_connection(conn)):
+                    return conn
+                try:
+                    conn.close()
+                except:
+                    pass
+        return self._create_connection()
 
     def release_connection(self, conn):
-        """释放短连接回池（带健康检查）"""
+        """释放短连接回本线程分片
+
+        归还时打上_last_used时间戳；连接刚被用过，无需再验活，
+        只有超过空闲阈值才做一次廉价的SO_ERROR检查。
+        """
         if conn is None:
             return
 
-        with self._lock:
-            if len(self._pool) < self._size and self._test_connection(conn):
-                self._pool.append(conn)
-            else:
-                try:
-                    conn.close()
-                except:
-                    pass
+        now = time.monotonic()
+        fresh = now - getattr(conn, '_last_used', 0.0) < self._LIVENESS_IDLE_S
+        conn._last_used = now
+        # 逐次归还不打日志，每1000次归还聚合一条DEBUG
+        self._release_count += 1
+        if _DEBUG_ENABLED and self._release_count % 1000 == 0:
+            logger.debug("连接池累计归还 {} 次", self._release_count)
+        if fresh or self._test_connection(conn):
+            idx = self._shard_index()
+            if self._slots[idx].acquire(blocking=False):
+                self._pools[idx].append(conn)
+                return
+        try:
+            conn.close()
+        except:
+            pass
 
     def check_persistent_connection(self):
         """增强版长连接检查（带自动恢复）"""
@@ -159,9 +334,9 @@ class ModbusConnectionPool:
             if not self._persistent_conn:
                 return False
 
-            # 心跳超时检测
-            if time.time() - self._last_heartbeat > 30:
-                if not self._test_connection(self._persistent_conn):
+            # 心跳超时检测（纳秒整数比较，无浮点分配）
+            if time.monotonic_ns() - self._last_heartbeat > 30_000_000_000:
+                if not self._probe_connection(self._persistent_conn):
                     logger.warning("长连接异常，触发自动恢复...")
                     try:
                         self._persistent_conn.close()
@@ -169,7 +344,7 @@ class ModbusConnectionPool:
                         pass
                     self._persistent_conn = self._create_connection(persistent=True)
 
-                self._last_heartbeat = time.time()
+                self._last_heartbeat = time.monotonic_ns()
 
             return self._persistent_conn is not None
 
@@ -182,15 +357,26 @@ class ModbusConnectionPool:
                 self._persistent_conn.close()
                 self._persistent_conn = None
 
-    def __del__(self):
-        """析构时清理所有连接"""
-        with self._lock:
-            for conn in self._pool:
+    def close_all(self):
+        """显式关闭所有连接并清空池"""
+        for idx, shard in enumerate(self._pools):
+            while True:
+                try:
+                    conn = shard.pop()
+                except IndexError:
+                    break
+                self._slots[idx].release()
                 try:
                     conn.close()
                 except:
                     pass
-            self._pool.clear()
 
         self.close_persistent_connection()
-        logger.info("连接池已销毁")
+        logger.info("连接池已关闭")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close_all()
+        return False
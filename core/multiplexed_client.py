@@ -0,0 +1,228 @@
+import socket
+import struct
+import threading
+import numpy as np
+from concurrent.futures import Future
+from loguru import logger
+from pymodbus.exceptions import ModbusException
+from config import settings
+
+class MultiplexedModbusClient:
+    """单socket多路复用Modbus TCP客户端
+
+    多主站场景下每个主站各开一条TCP连接、每个请求阻塞一个完整
+    RTT，吞吐被串行化限死。Modbus TCP的MBAP头自带事务ID，天然
+    支持流水线：这里用一条长连接承载所有主站的请求，发送端按
+    事务ID登记Future，后台读线程解析响应头并回填对应Future，
+    N个在途请求在线缆上重叠而不是排队。
+    """
+
+    _MBAP_LEN = 7    # 事务ID(2)+协议(2)+长度(2)+单元号(1)
+    _MAX_ADU = 260   # Modbus TCP单帧上限
+
+    def __init__(self, host=None, port=None, unit=1):
+        self._host = host or settings.CONTROLLER_IP
+        self._port = port or settings.CONTROLLER_PORT
+        self._unit = unit
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._pending = {}          # 事务ID -> (Future, 调用方输出缓冲或None)
+        self._pending_lock = threading.Lock()
+        self._txid = 0
+        self._reader = None
+        self._closing = False
+        # 固定形状读请求的完整ADU帧缓存：(功能码,地址,数量) -> 帧。
+        # 1ms节拍循环反复发同形状请求，逐次重建PDU纯属浪费，缓存
+        # 后每次发送只需pack_into改写头部2字节事务ID。帧是可变的
+        # bytearray，改写发生在本实例的发送锁内，因此缓存必须按
+        # 实例隔离——跨实例共享会让两个客户端互相覆盖事务ID
+        self._pdu_cache = {}
+        # 预分配接收缓冲：持续负载下每帧一个新bytes会以千次/秒的
+        # 频率喂GC，常驻缓冲+recv_into做到每请求零接收分配
+        self._rx_buf = bytearray(self._MAX_ADU)
+
+    def connect(self):
+        """建立连接并启动响应分发线程"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(settings.CONNECT_TIMEOUT)
+        sock.connect((self._host, self._port))
+        sock.settimeout(settings.RESPONSE_TIMEOUT)
+        if settings.DISABLE_NAGLE:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._closing = False
+        self._reader = threading.Thread(
+            target=self._reader_loop, name="modbus-mux-reader", daemon=True)
+        self._reader.start()
+        logger.success(f"多路复用连接建立 {self._host}:{self._port}")
+
+    def close(self):
+        """关闭连接，挂起的请求全部置失败
+
+        先shutdown再close：单纯close不会唤醒阻塞在recv_into里的
+        读线程，要等RESPONSE_TIMEOUT超时才退出，每次关闭白等2秒；
+        shutdown让阻塞的recv立即返回EOF，join瞬间完成。
+        """
+        self._closing = True
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                self._sock.close()
+            except Exception:
+                pass
+            self._sock = None
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join(timeout=2)
+            self._reader = None
+        self._fail_pending(ConnectionError("连接已关闭"))
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    # ------------------------------------------------------------------
+    # 发送侧
+    # ------------------------------------------------------------------
+
+    def submit(self, pdu):
+        """提交一帧PDU，返回响应Future"""
+        frame = bytearray(struct.pack(">HHHB", 0, 0, len(pdu) + 1, self._unit))
+        frame += pdu
+        return self._submit_frame(frame)
+
+    def _submit_frame(self, frame, out=None):
+        """发送一帧完整ADU，返回响应Future
+
+        事务ID分配、Future登记和sendall在发送锁内完成，保证ID与
+        登记顺序一致，也保证缓存帧在改写txid到发完之前不被其他
+        线程复用；响应到达由读线程异步回填，调用方可以在等待前
+        继续塞入后续请求形成流水线。
+        """
+        fut = Future()
+        with self._send_lock:
+            self._txid = (self._txid + 1) & 0xFFFF or 1
+            txid = self._txid
+            struct.pack_into(">H", frame, 0, txid)
+            with self._pending_lock:
+                self._pending[txid] = (fut, out)
+            try:
+                self._sock.sendall(frame)
+            except Exception as e:
+                with self._pending_lock:
+                    self._pending.pop(txid, None)
+                fut.set_exception(e)
+        return fut
+
+    def _read_frame(self, fc, address, count):
+        """取(或构建并缓存)固定形状读请求的完整帧"""
+        key = (fc, address, count)
+        frame = self._pdu_cache.get(key)
+        if frame is None:
+            pdu = struct.pack(">BHH", fc, address, count)
+            frame = bytearray(
+                struct.pack(">HHHB", 0, 0, len(pdu) + 1, self._unit) + pdu)
+            self._pdu_cache[key] = frame
+        return frame
+
+    def read_holding_registers(self, address, count):
+        """读保持寄存器（功能码3），阻塞等待结果"""
+        frame = self._read_frame(0x03, address, count)
+        return self._submit_frame(frame).result(timeout=settings.RESPONSE_TIMEOUT)
+
+    def read_holding_registers_into(self, address, count, out):
+        """读保持寄存器并解码进调用方复用的uint16缓冲
+
+        常规路径每次响应都新建寄存器list（1kHz下就是成千上万个
+        短命对象喂零代GC）。这里把大端数据直接拷进out（NumPy
+        uint16数组，按C速度转字节序），全程不产生响应对象，
+        返回寄存器个数。
+        """
+        frame = self._read_frame(0x03, address, count)
+        return self._submit_frame(frame, out).result(
+            timeout=settings.RESPONSE_TIMEOUT)
+
+    def read_input_registers(self, address, count):
+        """读输入寄存器（功能码4），阻塞等待结果"""
+        frame = self._read_frame(0x04, address, count)
+        return self._submit_frame(frame).result(timeout=settings.RESPONSE_TIMEOUT)
+
+    def write_registers(self, address, values):
+        """写多个保持寄存器（功能码16），阻塞等待结果"""
+        n = len(values)
+        pdu = struct.pack(f">BHHB{n}H", 0x10, address, n, n * 2, *values)
+        return self.submit(pdu).result(timeout=settings.RESPONSE_TIMEOUT)
+
+    # ------------------------------------------------------------------
+    # 接收侧
+    # ------------------------------------------------------------------
+
+    def _recv_into(self, offset, n):
+        """recv_into读满n字节到接收缓冲offset处，无新分配"""
+        view = memoryview(self._rx_buf)
+        got = 0
+        while got < n:
+            r = self._sock.recv_into(view[offset + got:offset + n], n - got)
+            if not r:
+                raise ConnectionError("对端关闭连接")
+            got += r
+
+    def _reader_loop(self):
+        """后台响应分发：解析MBAP头，按事务ID回填Future
+
+        整帧收进常驻缓冲，头部用unpack_from原位解析不做切片；
+        Future在下一次收帧前同步回填完毕，缓冲复用是安全的。
+        """
+        buf = self._rx_buf
+        try:
+            while not self._closing:
+                self._recv_into(0, self._MBAP_LEN)
+                txid, _proto, length = struct.unpack_from(">HHH", buf, 0)
+                self._recv_into(self._MBAP_LEN, length - 1)
+                pdu = memoryview(buf)[self._MBAP_LEN:self._MBAP_LEN + length - 1]
+                with self._pending_lock:
+                    fut, out = self._pending.pop(txid, (None, None))
+                if fut is None:
+                    logger.warning(f"收到未登记事务ID {txid} 的响应，丢弃")
+                    continue
+                self._resolve(fut, pdu, out)
+        except Exception as e:
+            if not self._closing:
+                logger.error(f"多路复用读线程退出: {e}")
+                self._fail_pending(e)
+
+    def _resolve(self, fut, pdu, out=None):
+        """按功能码解析响应PDU并回填Future"""
+        fc = pdu[0]
+        if fc & 0x80:
+            fut.set_exception(ModbusException(f"异常码 {pdu[1]} (功能码{fc & 0x7F})"))
+        elif fc in (0x03, 0x04):
+            count = pdu[1] // 2
+            if out is not None:
+                # 大端视图直接拷进调用方缓冲，不建list不建响应对象
+                out[:count] = np.frombuffer(pdu, dtype='>u2', offset=2, count=count)
+                fut.set_result(count)
+            else:
+                registers = list(struct.unpack(f">{count}H", pdu[2:2 + count * 2]))
+                fut.set_result(registers)
+        elif fc == 0x10:
+            addr, n = struct.unpack(">HH", pdu[1:5])
+            fut.set_result(n)
+        else:
+            # 未知功能码：拷出字节，缓冲会被下一帧复用
+            fut.set_result(bytes(pdu))
+
+    def _fail_pending(self, exc):
+        """把所有在途请求置为失败"""
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for fut, _out in pending:
+            if not fut.done():
+                fut.set_exception(exc)
@@ -0,0 +1,120 @@
+import numpy as np
+from pymodbus.exceptions import ModbusException
+from config import settings
+
+# HdrHistogram为可选依赖：缺失时退化为NumPy环形缓冲
+try:
+    from hdrh.histogram import HdrHistogram
+except ImportError:
+    HdrHistogram = None
+
+
+def merge_register_ranges(ranges, max_count=None, max_gap=1):
+    """合并相邻/重叠的寄存器读取区间
+
+    N个相邻的单寄存器读取要付N个RTT，功能码3单次最多能读
+    max_count个寄存器，合并成一个窗口只付一次。按起始地址排序后
+    贪心合并：间隙不超过max_gap且窗口总长不超过max_count的区间
+    并入同一窗口。
+
+    返回(windows, mapping)：windows为合并后的(addr, count)列表，
+    mapping[i]是第i个原始区间在窗口中的(窗口下标, 偏移)。
+    """
+    if max_count is None:
+        max_count = settings.MAX_REGISTERS_PER_READ
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    merged = []  # [起始地址, 结束地址)
+    mapping = [None] * len(ranges)
+    for i in order:
+        addr, count = ranges[i]
+        end = addr + count
+        if merged:
+            w_addr, w_end = merged[-1]
+            if addr - w_end <= max_gap and max(w_end, end) - w_addr <= max_count:
+                merged[-1][1] = max(w_end, end)
+                mapping[i] = (len(merged) - 1, addr - w_addr)
+                continue
+        merged.append([addr, end])
+        mapping[i] = (len(merged) - 1, 0)
+    windows = [(a, e - a) for a, e in merged]
+    return windows, mapping
+
+
+def read_holding_registers_batch(conn, ranges):
+    """按合并窗口批量读保持寄存器，再按原始区间拆散返回
+
+    每个合并窗口只发一次功能码3请求，结果按mapping切片还给各
+    原始区间，调用方拿到与ranges一一对应的寄存器值列表。
+    """
+    windows, mapping = merge_register_ranges(ranges)
+    window_regs = []
+    for addr, count in windows:
+        result = conn.read_holding_registers(address=addr, count=count)
+        if result.isError():
+            raise ModbusException(f"批量读取失败: {result}")
+        window_regs.append(result.registers)
+    return [window_regs[w][off:off + count]
+            for (_, count), (w, off) in zip(ranges, mapping)]
+
+
+class LatencyHistogram:
+    """微秒级延迟/周期直方图
+
+    无限增长的样本列表只能算出均值和极值，还把尾延迟藏在
+    O(N)内存里。HdrHistogram以O(1)内存、O(1)记录代价提供任意
+    百分位；未安装hdrhistogram时退化为固定大小的NumPy环形缓冲
+    （百分位用np.partition选择）。
+    """
+
+    _FALLBACK_SIZE = 1 << 20
+
+    def __init__(self, lowest=1, highest=60_000_000, sig_figs=3):
+        if HdrHistogram is not None:
+            self._hdr = HdrHistogram(lowest, highest, sig_figs)
+            self._buf = None
+        else:
+            self._hdr = None
+            self._buf = np.empty(self._FALLBACK_SIZE, dtype=np.float64)
+        self._n = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._min = float('inf')
+
+    def record(self, value_us):
+        """记录一个微秒值"""
+        if self._hdr is not None:
+            self._hdr.record_value(int(value_us))
+        else:
+            self._buf[self._n % self._FALLBACK_SIZE] = value_us
+        self._n += 1
+        self._sum += value_us
+        if value_us > self._max:
+            self._max = value_us
+        if value_us < self._min:
+            self._min = value_us
+
+    @property
+    def count(self):
+        return self._n
+
+    @property
+    def mean_us(self):
+        return self._sum / self._n if self._n else 0.0
+
+    @property
+    def max_us(self):
+        return self._max if self._n else 0.0
+
+    @property
+    def min_us(self):
+        return self._min if self._n else 0.0
+
+    def percentile_us(self, pct):
+        """取指定百分位的微秒值"""
+        if self._n == 0:
+            return 0.0
+        if self._hdr is not None:
+            return float(self._hdr.get_value_at_percentile(pct))
+        arr = self._buf[:min(self._n, self._FALLBACK_SIZE)]
+        k = min(int(arr.size * pct / 100.0), arr.size - 1)
+        return float(np.partition(arr, k)[k])
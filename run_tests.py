@@ -1,27 +1,29 @@
 
+import sys
 import pytest
 import time
 from datetime import datetime
 from loguru import logger
 
+# 日志sink在导入时注册一次，避免与pytest自身的handler重复初始化
+# enqueue=True: 日志写入走后台线程队列，突发错误不会阻塞测试循环
+logger.add("logs/test_run_{time}.log", rotation="100 MB", encoding="utf-8", enqueue=True)
 
-def main():
-    logger.add("logs/test_run_{time}.log", rotation="100 MB", encoding="utf-8")
 
+def main():
     start_time = time.time()
     logger.info(f"开始测试套件执行 - {datetime.now()}")
 
-    # 执行测试用例1
-    logger.info("执行测试用例1: 1ms精度Modbus压力测试")
-    pytest.main(["-v", "tests/test_case1.py"])
-
-    # 执行测试用例2
-    logger.info("执行测试用例2: 多主站混合场景测试")
-    pytest.main(["-v", "tests/test_case2.py"])
+    # 用例合并进一次pytest会话：收集机制、conftest和fixture
+    # 只初始化一遍，类级fixture也能跨文件共享。多路复用客户端
+    # 用回环假PLC自验，不依赖真实硬件
+    exit_code = pytest.main(["-v", "tests/test_case1.py", "tests/test_case2.py",
+                             "tests/test_multiplexed.py"])
 
     duration = time.time() - start_time
     logger.success(f"测试套件执行完成 - 总耗时: {duration:.2f}秒")
+    return exit_code
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -1,4 +1,5 @@
 from core.connection import ModbusConnectionPool
+from core.utils import read_holding_registers_batch
 from loguru import logger
 import time
 
@@ -14,32 +15,28 @@ def test_connection():
 
     pool = ModbusConnectionPool()
 
-    for i, test in enumerate(test_cases, 1):
-        conn = None
-        try:
-            conn = pool.get_connection()
-            logger.info(f"测试#{i}: {test['desc']} - 地址:{test['address']} 数量:{test['count']}")
-
-            # 添加延迟确保连接稳定
-            time.sleep(0.1)
-
-            result = conn.read_holding_registers(
-                address=test["address"],
-                count=test["count"]
-            )
-
-            if result.isError():
-                logger.error(f"测试#{i} 错误响应: {str(result)}")
-            else:
-                logger.success(f"测试#{i} 成功 - 值: {result.registers}")
-
-        except Exception as e:
-            logger.error(f"测试#{i} 失败: {type(e).__name__}: {str(e)}")
-            logger.debug("完整堆栈:", exc_info=e)
-        finally:
-            if conn:
-                pool.release_connection(conn)
-            time.sleep(0.5)  # 连接间延迟
+    # 所有用例区间合并后一次批量下发，免去逐用例建连+RTT
+    conn = None
+    last_error = None
+    last_latency_ms = 0.0
+    try:
+        conn = pool.get_connection()
+        ranges = [(test["address"], test["count"]) for test in test_cases]
+        start = time.perf_counter()
+        values = read_holding_registers_batch(conn, ranges)
+        last_latency_ms = (time.perf_counter() - start) * 1000
+        for i, (test, regs) in enumerate(zip(test_cases, values), 1):
+            logger.success(f"测试#{i} {test['desc']} - 地址:{test['address']} 值: {regs}")
+    except Exception as e:
+        last_error = e
+        logger.error(f"测试失败: {type(e).__name__}: {str(e)}")
+        logger.debug("完整堆栈:", exc_info=e)
+    finally:
+        if conn:
+            pool.release_connection(conn)
+        # 仅在失败或延迟异常时加恢复等待，快路径零空等
+        if last_error or last_latency_ms > 50:
+            time.sleep(0.5)
 
     logger.info("=== 测试完成 ===")
 
@@ -1,4 +1,5 @@
 from core.connection import ModbusConnectionPool
+from core.utils import read_holding_registers_batch
 from loguru import logger
 import time
 import sys
@@ -15,29 +16,28 @@ def test_holding_registers():
 
     pool = ModbusConnectionPool()
 
-    for case in TEST_CASES:
-        conn = None
-        try:
-            conn = pool.get_connection()
-            logger.info(f"测试: {case['desc']} [地址:{case['address']}]")
-
-            # PyModbus 3.x 兼容调用
-            result = conn.read_holding_registers(
-                address=case["address"],
-                count=case["count"]
-            )
-
-            if result.isError():
-                logger.error(f"响应错误: {result}")
-            else:
-                logger.success(f"读取成功: {result.registers}")
-
-        except Exception as e:
-            logger.error(f"测试失败: {str(e)}")
-        finally:
-            if conn:
-                pool.release_connection(conn)
-            time.sleep(1)  # 确保对端释放资源
+    # 相邻区间合并为单次功能码3请求：两个用例(0,1)+(1,2)只发
+    # 一帧(0,3)，结果按原始区间拆散返回
+    conn = None
+    last_error = None
+    last_latency_ms = 0.0
+    try:
+        conn = pool.get_connection()
+        ranges = [(case["address"], case["count"]) for case in TEST_CASES]
+        start = time.perf_counter()
+        values = read_holding_registers_batch(conn, ranges)
+        last_latency_ms = (time.perf_counter() - start) * 1000
+        for case, regs in zip(TEST_CASES, values):
+            logger.success(f"{case['desc']} [地址:{case['address']}] 读取成功: {regs}")
+    except Exception as e:
+        last_error = e
+        logger.error(f"测试失败: {str(e)}")
+    finally:
+        if conn:
+            pool.release_connection(conn)
+        # 仅在失败或延迟异常时等对端恢复，快路径不再固定空等1秒
+        if last_error or last_latency_ms > 50:
+            time.sleep(1)
 
     logger.info("=== 测试完成 ===")
 
@@ -1,52 +1,45 @@
 import pytest
-import threading
+import asyncio
 import random
-import time
-from core.client import HighPrecisionModbusClient
+from core.async_client import HighPrecisionAsyncModbusClient
 from config import settings
 from loguru import logger
 
 
 class TestMultiMasterScenario:
-    @pytest.fixture(scope="class")
-    def clients(self):
-        return [HighPrecisionModbusClient() for _ in range(4)]
 
-    def test_multiple_masters(self, clients):
-        """测试用例2: 多主站混合场景测试"""
+    @pytest.mark.asyncio
+    async def test_multiple_masters(self):
+        """测试用例2: 多主站混合场景测试（共享客户端版）
 
-        def master_worker(client_id, client):
+        连接池本就被所有主站共享，4个客户端包装器只是4份重复的
+        统计结构和报告任务，彼此的close_all还会随机杀掉别人的
+        在途请求。改为全体主站共享一个客户端：压测主体由一个
+        run_test承担，各主站配置中的随机断开/延迟重连行为作为
+        独立扰动协程作用在同一个连接池上。
+        """
+        client = HighPrecisionAsyncModbusClient()
+
+        async def disruptor(client_id):
+            """按主站配置对共享连接池施加断开/重连扰动"""
             config = settings.MASTER_CONFIGS[f"master_{client_id + 1}"]
             logger.info(f"启动主站{client_id + 1}: {config['description']}")
 
-            end_time = time.time() + settings.TEST_DURATION
-            while time.time() < end_time:
-                # 随机断开逻辑
+            loop = asyncio.get_running_loop()
+            end_time = loop.time() + settings.TEST_DURATION
+            while loop.time() < end_time:
                 if (config["disconnect_prob"] > 0 and
                         random.random() < config["disconnect_prob"]):
-                    client.pool.close_all()
+                    await client.pool.close_all()
                     delay = random.uniform(*config["reconnect_delay"])
-                    time.sleep(delay)
-
-                # 执行测试
-                client.run_test(
-                    duration=1,  # 每次运行1秒
-                    use_busy_wait=(client_id == 3)  # 只有主站4使用忙等待
-                )
-
-                # 周期控制
-                if config["cycle_time"] and client_id != 3:
-                    time.sleep(config["cycle_time"])
-
-        threads = []
-        for i, client in enumerate(clients):
-            t = threading.Thread(
-                target=master_worker,
-                args=(i, client),
-                name=f"Master-{i + 1}"
+                    await asyncio.sleep(delay)
+                # 扰动检查节奏沿用各主站的周期配置
+                await asyncio.sleep(config["cycle_time"] or 1.0)
+
+        try:
+            await asyncio.gather(
+                client.run_test(duration=settings.TEST_DURATION),
+                *[disruptor(i) for i in range(4)],
             )
-            t.start()
-            threads.append(t)
-
-        for t in threads:
-            t.join()
+        finally:
+            await client.cleanup()
@@ -0,0 +1,115 @@
+import socket
+import struct
+import threading
+import numpy as np
+import pytest
+from core.multiplexed_client import MultiplexedModbusClient
+
+
+class LoopbackModbusServer:
+    """回环假PLC：按MBAP协议应答读/写请求，无需真实硬件
+
+    fc3/fc4返回"寄存器值=地址+偏移"的确定性数据，客户端可据此
+    校验每个事务拿回的是自己的响应；reorder开启时攒两个请求后
+    倒序应答，用于验证按事务ID解复用而非按到达顺序配对。
+    """
+
+    def __init__(self, reorder=False):
+        self._reorder = reorder
+        self._srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._srv.bind(('127.0.0.1', 0))
+        self._srv.listen(1)
+        self.port = self._srv.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _recv_exact(self, conn, n):
+        data = b''
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def _handle_one(self, conn):
+        mbap = self._recv_exact(conn, 7)
+        txid, proto, length, unit = struct.unpack(">HHHB", mbap)
+        pdu = self._recv_exact(conn, length - 1)
+        fc = pdu[0]
+        if fc in (0x03, 0x04):
+            addr, count = struct.unpack(">HH", pdu[1:5])
+            regs = [(addr + i) & 0xFFFF for i in range(count)]
+            body = struct.pack(f">BB{count}H", fc, count * 2, *regs)
+        else:  # fc16：回显地址与数量
+            addr, n = struct.unpack(">HH", pdu[1:5])
+            body = struct.pack(">BHH", fc, addr, n)
+        return struct.pack(">HHHB", txid, proto, len(body) + 1, unit) + body
+
+    def _serve(self):
+        conn, _ = self._srv.accept()
+        try:
+            while True:
+                if self._reorder:
+                    first = self._handle_one(conn)
+                    second = self._handle_one(conn)
+                    conn.sendall(second + first)
+                else:
+                    conn.sendall(self._handle_one(conn))
+        except (ConnectionError, OSError):
+            pass
+
+    def close(self):
+        self._srv.close()
+
+
+@pytest.fixture
+def loopback_client():
+    server = LoopbackModbusServer()
+    client = MultiplexedModbusClient(host='127.0.0.1', port=server.port)
+    client.connect()
+    yield client
+    client.close()
+    server.close()
+
+
+class TestMultiplexedClient:
+
+    def test_pipelined_reads(self, loopback_client):
+        """多个在途请求各自拿回自己地址段的数据"""
+        futs = [loopback_client._submit_frame(
+                    loopback_client._read_frame(0x03, addr, 4))
+                for addr in (0, 100, 500)]
+        for addr, fut in zip((0, 100, 500), futs):
+            assert fut.result(timeout=2) == [addr + i for i in range(4)]
+
+    def test_out_of_order_responses(self):
+        """响应乱序到达时按事务ID解复用，不按到达顺序配对"""
+        server = LoopbackModbusServer(reorder=True)
+        client = MultiplexedModbusClient(host='127.0.0.1', port=server.port)
+        client.connect()
+        try:
+            fut_a = client._submit_frame(client._read_frame(0x03, 10, 2))
+            fut_b = client._submit_frame(client._read_frame(0x03, 20, 2))
+            assert fut_a.result(timeout=2) == [10, 11]
+            assert fut_b.result(timeout=2) == [20, 21]
+        finally:
+            client.close()
+            server.close()
+
+    def test_read_into_buffer(self, loopback_client):
+        """零分配读路径把数据解码进调用方复用缓冲"""
+        out = np.empty(8, dtype=np.uint16)
+        n = loopback_client.read_holding_registers_into(300, 8, out)
+        assert n == 8
+        assert out.tolist() == [300 + i for i in range(8)]
+
+    def test_write_registers(self, loopback_client):
+        assert loopback_client.write_registers(50, [1, 2, 3]) == 3
+
+    def test_txid_wraparound(self, loopback_client):
+        """事务ID回卷时跳过0（0保留不用）"""
+        loopback_client._txid = 0xFFFE
+        for addr in (1, 2, 3):
+            assert loopback_client.read_holding_registers(addr, 1) == [addr]
+        assert loopback_client._txid == 2  # 0xFFFF -> 1 -> 2